@@ -14,7 +14,18 @@ from forms import RegisterForm, LoginForm, EditAccountForm
 from config import Config   
 from seed_db import seed_default_users
 from models import Quiz, Question, QuizSubmission, QuizAssignments
+from counters import (
+    PENDING_MARKING,
+    AVAILABLE_QUIZZES,
+    NEW_SCORES,
+    bump_counter,
+    refresh_user_counters,
+    reconcile_counters,
+    create_counter_table,
+    dashboard_counters,
+)
 import json
+import click
 from sqlalchemy.orm import joinedload
 
 # Create the Flask app instance
@@ -35,6 +46,14 @@ def load_user(user_id):
     return db.session.get(User, int(user_id))
 
 
+@app.cli.command("reconcile-counters")
+def reconcile_counters_command():
+    """Rebuild the cached dashboard counters (e.g. from a cron job)."""
+    create_counter_table()  # In case "python app.py" hasn't upgraded this database yet
+    corrected = reconcile_counters()
+    click.echo(f"Dashboard counters reconciled, {corrected} corrected.")
+
+
 @app.route("/")
 def home():
     """Redirect users from the home page to the dashboard."""
@@ -138,6 +157,7 @@ def manage_quiz():
             user = User.query.get(int(user_id))
             if user:
                 quiz.assigned_users.append(user)
+                bump_counter(AVAILABLE_QUIZZES, user.id, 1)
         db.session.commit()  # Commit after assigning users
 
         # Add questions to the quiz
@@ -193,6 +213,10 @@ def delete_quiz(quiz_id):
     db.session.execute(
         QuizAssignments.update().where(QuizAssignments.c.quiz_id == quiz.id).values(hidden=True)
     )
+    # Recompute the per-user counters this quiz contributed to
+    refresh_user_counters(
+        {user.id for user in quiz.assigned_users} | {sub.user_id for sub in quiz.submissions}
+    )
     db.session.commit()
     flash('Quiz and its questions have been hidden.', 'success')
     return redirect(url_for('existing_quizzes'))
@@ -200,7 +224,7 @@ def delete_quiz(quiz_id):
 @app.route("/dashboard")
 @login_required
 def dashboard():
-    return render_template("dashboard.html")
+    return render_template("dashboard.html", counters=dashboard_counters(current_user))
 
 
 @app.route("/account", methods=["GET", "POST"])
@@ -267,7 +291,7 @@ def users():
 @app.route('/submit_quiz_for_review', methods=['POST'])
 @login_required
 def submit_quiz_for_review():
-    quiz_id = request.form.get('quiz_id')
+    quiz_id = request.form.get('quiz_id', type=int)
     existing = QuizSubmission.query.filter_by(user_id=current_user.id, quiz_id=quiz_id).first()
     if existing:
         flash("You have already submitted this quiz.", "info")
@@ -282,6 +306,11 @@ def submit_quiz_for_review():
         answers=answers
     )
     db.session.add(submission)
+    bump_counter(PENDING_MARKING, quiz_id, 1)
+    # The quiz only counted as available if it is visible and assigned to this user
+    quiz = db.session.get(Quiz, quiz_id)
+    if quiz and not quiz.hidden and any(user.id == current_user.id for user in quiz.assigned_users):
+        bump_counter(AVAILABLE_QUIZZES, current_user.id, -1)
     db.session.commit()
 
     flash("Quiz submitted successfully for review!", "success")
@@ -327,9 +356,16 @@ def admin_mark_quiz(submission_id):
             score = max(0, min(score, question.points))
             total_score += score
         
+        # Keep the dashboard counters in step (re-marking doesn't count twice)
+        if not submission.marked:
+            bump_counter(PENDING_MARKING, submission.quiz_id, -1)
+        if not submission.hidden and (not submission.marked or submission.viewed):
+            bump_counter(NEW_SCORES, submission.user_id, 1)
+
         # Update submission with score and mark as complete
         submission.score = total_score
         submission.marked = True
+        submission.viewed = False  # Let the user know there is a new score
         db.session.commit()
         
         flash(f"Quiz marked successfully. Total score: {total_score}", "success")
@@ -366,6 +402,11 @@ def my_scores():
         hidden=False
     ).all()
 
+    # The user has now seen these scores, so update their new score notification
+    for submission in marked_submissions:
+        submission.viewed = True
+    refresh_user_counters([current_user.id])
+
     quizzes_to_delete = set()
     # Check if all assigned users have marked submissions for each quiz
     for submission in marked_submissions:
@@ -403,6 +444,7 @@ def toggle_quiz_visibility(quiz_id):
     if not quiz:
         abort(404)
     quiz.hidden = not quiz.hidden
+    refresh_user_counters(user.id for user in quiz.assigned_users)
     db.session.commit()
     return redirect(url_for('existing_quizzes'))
 
@@ -413,6 +455,7 @@ def toggle_score_visibility(submission_id):
     if submission.user_id != current_user.id:
         abort(403)
     submission.hidden = not submission.hidden
+    refresh_user_counters([submission.user_id])
     db.session.commit()
     return redirect(url_for('my_scores'))
 
@@ -439,7 +482,9 @@ if __name__ == "__main__":
     This block runs only when this file is executed directly (not imported), i.e. "python app.py".
     """
     with app.app_context():
+        create_counter_table()  # First run with counters: mark existing scores as viewed
         db.create_all()  # Create tables if they don't exist
         seed_default_users()  # Add default admin and regular users
+        reconcile_counters()  # Build the cached dashboard counters
 
     app.run(debug=True)  # Start the server with debug mode (auto-reloads on changes)
\ No newline at end of file
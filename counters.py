@@ -0,0 +1,195 @@
+# Cached dashboard counters.
+#
+# The dashboard shows a few numbers (quizzes waiting to be marked, quizzes a
+# student still has to take, newly marked scores). Working these out means
+# scanning submissions and assignments, so instead we keep them in the
+# DashboardCounter table and update them whenever a route changes the data
+# they depend on. reconcile_counters() rebuilds everything from scratch and
+# is run at startup and from the "reconcile-counters" CLI command (e.g. cron)
+# to repair any drift.
+from sqlalchemy import func, exists, literal, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Quiz, QuizSubmission, QuizAssignments, DashboardCounter
+
+# Counter names
+PENDING_MARKING = "pending_marking"  # unmarked submissions, keyed by quiz id
+AVAILABLE_QUIZZES = "available_quizzes"  # quizzes left to take, keyed by user id
+NEW_SCORES = "new_scores"  # marked but unseen scores, keyed by user id
+
+
+def create_counter_table():
+    """
+    Create the DashboardCounter table if this database doesn't have it yet.
+    - Nothing used to set QuizSubmission.viewed, so scores marked before the
+      counters existed are flagged as viewed instead of all showing as new.
+    - Does nothing on a database that already has the table.
+    """
+    if inspect(db.engine).has_table(DashboardCounter.__tablename__):
+        return False
+    db.create_all()
+    QuizSubmission.query.filter_by(marked=True).update({QuizSubmission.viewed: True})
+    db.session.commit()
+    return True
+
+
+def get_counter(name, key_id):
+    """Return the cached value of a counter (a single primary key lookup)."""
+    counter = db.session.get(DashboardCounter, (name, key_id))
+    if counter is None:
+        return 0
+    return max(counter.value, 0)
+
+
+def bump_counter(name, key_id, delta):
+    """
+    Add delta to a counter as part of the current transaction.
+    - Done as a single upsert, so concurrent requests (or several bumps in one
+      request) don't lose updates, even when the row doesn't exist yet.
+    - The caller is responsible for committing.
+    """
+    stmt = sqlite_insert(DashboardCounter).values(
+        name=name, key_id=key_id, value=max(delta, 0)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name", "key_id"],
+        set_={"value": DashboardCounter.value + delta},
+    )
+    db.session.execute(stmt)
+
+
+def set_counter(name, key_id, value):
+    """Overwrite a counter with a freshly computed value (caller commits)."""
+    stmt = sqlite_insert(DashboardCounter).values(name=name, key_id=key_id, value=value)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name", "key_id"],
+        set_={"value": stmt.excluded.value},
+    )
+    db.session.execute(stmt)
+
+
+def _pending_marking_query(quiz_ids=None):
+    """
+    Query the number of unmarked submissions per quiz.
+    - Hidden submissions still count, matching the admin Mark Quizzes page.
+    """
+    query = (
+        db.session.query(QuizSubmission.quiz_id, func.count(QuizSubmission.id))
+        .filter(QuizSubmission.marked == False)
+    )
+    if quiz_ids is not None:
+        query = query.filter(QuizSubmission.quiz_id.in_(quiz_ids))
+    return query.group_by(QuizSubmission.quiz_id)
+
+
+def _available_quizzes_query(user_ids=None):
+    """Query the number of visible assigned quizzes each user has not submitted yet."""
+    already_submitted = exists().where(
+        QuizSubmission.user_id == QuizAssignments.c.user_id,
+        QuizSubmission.quiz_id == QuizAssignments.c.quiz_id,
+    )
+    query = (
+        db.session.query(QuizAssignments.c.user_id, func.count(QuizAssignments.c.quiz_id))
+        .join(Quiz, Quiz.id == QuizAssignments.c.quiz_id)
+        .filter(Quiz.hidden == False, ~already_submitted)
+    )
+    if user_ids is not None:
+        query = query.filter(QuizAssignments.c.user_id.in_(user_ids))
+    return query.group_by(QuizAssignments.c.user_id)
+
+
+def _new_scores_query(user_ids=None):
+    """Query the number of marked, visible submissions each user has not looked at yet."""
+    query = (
+        db.session.query(QuizSubmission.user_id, func.count(QuizSubmission.id))
+        .filter(
+            QuizSubmission.marked == True,
+            QuizSubmission.viewed == False,
+            QuizSubmission.hidden == False,
+        )
+    )
+    if user_ids is not None:
+        query = query.filter(QuizSubmission.user_id.in_(user_ids))
+    return query.group_by(QuizSubmission.user_id)
+
+
+# Each counter and the query that works out its true values
+COUNTER_QUERIES = {
+    PENDING_MARKING: _pending_marking_query,
+    AVAILABLE_QUIZZES: _available_quizzes_query,
+    NEW_SCORES: _new_scores_query,
+}
+
+
+def refresh_user_counters(user_ids):
+    """Recompute the per-user counters for the given users only (caller commits)."""
+    user_ids = list(user_ids)
+    available = dict(_available_quizzes_query(user_ids).all())
+    new_scores = dict(_new_scores_query(user_ids).all())
+    for user_id in user_ids:
+        set_counter(AVAILABLE_QUIZZES, user_id, available.get(user_id, 0))
+        set_counter(NEW_SCORES, user_id, new_scores.get(user_id, 0))
+
+
+def reconcile_counters():
+    """
+    Rebuild every counter from the underlying tables.
+    - Fixes counters that drifted from the real data.
+    - Adds counters that are missing and zeroes ones with nothing left to count.
+    - The counts are worked out and written by the same SQL statements, so an
+      increment committed while this runs is never overwritten.
+    - Returns the number of counters that had to be corrected.
+    """
+    corrected = 0
+    for name, counts_query in COUNTER_QUERIES.items():
+        counts = counts_query().subquery()
+        key_id, value = counts.c
+
+        # Insert or correct every counter that should be non-zero
+        stmt = sqlite_insert(DashboardCounter).from_select(
+            ["name", "key_id", "value"],
+            db.session.query(literal(name), key_id, value).filter(value > 0),
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["name", "key_id"],
+            set_={"value": stmt.excluded.value},
+            where=DashboardCounter.value != stmt.excluded.value,
+        )
+        corrected += db.session.execute(stmt).rowcount
+
+        # Zero any counter that no longer has anything to count
+        corrected += (
+            DashboardCounter.query
+            .filter(
+                DashboardCounter.name == name,
+                DashboardCounter.value != 0,
+                DashboardCounter.key_id.notin_(db.session.query(key_id)),
+            )
+            .update({DashboardCounter.value: 0}, synchronize_session=False)
+        )
+    db.session.commit()
+    return corrected
+
+
+def dashboard_counters(user):
+    """
+    Collect the counters shown on the dashboard for the given user.
+    - Admins get the number of unmarked submissions, overall and per quiz.
+    - Regular users get their available quiz and new score counts.
+    """
+    if user.is_admin:
+        rows = (
+            db.session.query(Quiz.id, Quiz.title, DashboardCounter.value)
+            .join(DashboardCounter, DashboardCounter.key_id == Quiz.id)
+            .filter(DashboardCounter.name == PENDING_MARKING, DashboardCounter.value > 0)
+            .order_by(Quiz.title)
+            .all()
+        )
+        return {
+            "pending_marking": sum(row.value for row in rows),
+            "pending_by_quiz": rows,
+        }
+    return {
+        "available_quizzes": get_counter(AVAILABLE_QUIZZES, user.id),
+        "new_scores": get_counter(NEW_SCORES, user.id),
+    }
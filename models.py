@@ -100,3 +100,15 @@ class QuizSubmission(db.Model):
             except:
                 return {}
         return self.answers or {}
+
+
+class DashboardCounter(db.Model):
+    # Cached dashboard tile values, kept up to date by the route handlers
+    # name: which counter this is, e.g. 'pending_marking' (keyed by quiz id),
+    #       'available_quizzes' or 'new_scores' (keyed by user id)
+    name = db.Column(db.String(50), primary_key=True)
+    key_id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<DashboardCounter {self.name}[{self.key_id}]={self.value}>"